@@ -1,21 +1,176 @@
-import google.generativeai as genai
-import json
+import orjson
 import time
 import random
-import requests
+import hashlib
+import re
+import threading
+import itertools
+import utils
+from functools import cache
+from cachetools import LRUCache, TTLCache, cached
+from cachetools.keys import hashkey
 
-def get_gemini_response(prompt, api_key):
-    """Helper to get response from Gemini with retry logic."""
-    genai.configure(api_key=api_key)
-    # Using flash-lite to minimize quota usage
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
+# In-process caches for Gemini results, keyed on a hash of the resume text so
+# re-submitting the same PDF (or a Streamlit rerun) skips the API round-trip.
+# Failed calls raise inside the cached helpers, so fallbacks are never cached.
+_RESUME_CACHE = LRUCache(maxsize=128)
+_COVER_LETTER_CACHE = LRUCache(maxsize=128)
+_COVER_LETTER_BATCH_CACHE = LRUCache(maxsize=128)
+_INTERVIEW_CACHE = LRUCache(maxsize=128)
+_BUNDLE_CACHE = LRUCache(maxsize=128)
+# JSearch results per (role, location); repeat searches within 30 minutes skip the
+# API entirely, saving the free tier's 200 requests/month
+_JSEARCH_CACHE = TTLCache(maxsize=64, ttl=1800)
+_CACHE_LOCK = threading.Lock()
+
+# Caps concurrent Gemini requests when agents are called from worker threads,
+# keeping the free-tier RPM quota from being hit by a burst of parallel calls.
+_GEMINI_SEMAPHORE = threading.Semaphore(2)
+
+class _RateLimiter:
+    """Token-bucket limiter: sleeps only when requests outpace the allowed rate."""
+
+    def __init__(self, rate_per_min, capacity=3):
+        self.rate_per_min = rate_per_min
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, waiting for a refill if the bucket is empty."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate_per_min / 60)
+            self._last_refill = now
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self.rate_per_min * 60)
+                self._last_refill = time.monotonic()
+                self._tokens = 0
+            else:
+                self._tokens -= 1
+
+# Stays under gemini-2.0-flash-lite's free-tier limit of 15 requests per minute
+_LIMITER = _RateLimiter(rate_per_min=12)
+
+def _text_hash(text):
+    """Returns a stable content hash used as a cache key."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def _require_response(response):
+    """Raises if Gemini gave no usable response, so the result isn't cached."""
+    if not response or response.startswith("Error:"):
+        raise RuntimeError(response or "Gemini returned no response")
+    return response
+
+# Markdown code fences (```json, ```JSON, ```python, bare ```) around model output
+_JSON_FENCE_RE = re.compile(r'```[a-zA-Z]*\n?|```')
+
+def _parse_json_response(response_text):
+    """Parses JSON from a model response, tolerating code fences and surrounding prose."""
+    cleaned = _JSON_FENCE_RE.sub("", response_text).strip()
+    try:
+        return orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        # Fall back to the outermost {...} block before giving up
+        return orjson.loads(cleaned[cleaned.index("{"):cleaned.rindex("}") + 1])
+
+# google.generativeai and requests are imported on first use rather than at module
+# import, keeping them off the Streamlit cold-start path
+@cache
+def _genai():
+    import google.generativeai as genai
+    return genai
+
+@cache
+def _http_session():
+    """Shared HTTP session so connections to the JSearch API are reused across calls."""
+    import requests
+    return requests.Session()
+
+# Configured Gemini models, one per API key, so the SDK is set up once per key
+_MODEL_CACHE = {}
+
+# Static prompt preambles. Every prompt is built as PREAMBLE + dynamic content, with the
+# preamble first, so moving a preamble into Gemini context caching
+# (genai.caching.CachedContent.create(contents=[preamble])) is a one-line change.
+_PARSE_PREAMBLE = """Analyze the following resume text and extract the 'Job Role' (e.g., Python Developer, Data Scientist) and a list of 'Key Skills'.
+Return ONLY valid JSON format like this:
+{
+    "role": "extracted role",
+    "skills": ["skill1", "skill2", "skill3"]
+}
+
+Resume Text:
+"""
+
+_COVER_PREAMBLE = """Write a professional and personalized cover letter for the job below.
+
+Instructions:
+- Be concise (max 180 words)
+- Mention specific skills that match the job description
+- Be professional and enthusiastic
+- Do NOT use generic phrases like "I am writing to express"
+"""
+
+_COVER_BATCH_PREAMBLE = """Generate a professional and personalized cover letter for each job below.
+Start each letter with its marker on its own line: ===LETTER_1=== for Job 1, ===LETTER_2=== for Job 2, and so on.
+
+Instructions:
+- Be concise (max 180 words per letter)
+- Mention specific skills that match each job description
+- Be professional and enthusiastic
+- Do NOT use generic phrases like "I am writing to express"
+"""
+
+_INTERVIEW_PREAMBLE = """You are an expert interview coach. Generate 10 targeted interview questions for a candidate who just applied to the jobs below.
+
+Generate 10 specific interview questions that:
+1. Match the technical skills required in the actual job descriptions
+2. Reference the candidate's actual experience from their resume
+3. Include both technical and behavioral questions
+4. Are specific — not generic
+
+Format as a numbered list. Each question should be on its own line.
+"""
+
+_BUNDLE_PREAMBLE = """You are an expert career assistant. Given the RESUME and JOBS below, return ONLY valid JSON in this format:
+{
+    "role": "the candidate's job role",
+    "skills": ["skill1", "skill2", "skill3"],
+    "letters": [{"company": "company name", "text": "cover letter"}]
+}
+
+Rules:
+- "letters": one professional, personalized cover letter per job, in the same order as JOBS.
+  Max 180 words each, mention specific skills that match the job description, be enthusiastic,
+  and do NOT use generic phrases like "I am writing to express".
+"""
+
+def get_gemini_response(prompt, api_key, stream=False, generation_config=None):
+    """
+    Helper to get response from Gemini with retry logic.
+    generation_config is passed through to generate_content (e.g. to request JSON output).
+    With stream=True, returns an iterator of text chunks instead (no retries; raises if the stream fails).
+    """
+    model = _MODEL_CACHE.get(api_key)
+    if model is None:
+        genai = _genai()
+        genai.configure(api_key=api_key)
+        # Using flash-lite to minimize quota usage
+        model = _MODEL_CACHE[api_key] = genai.GenerativeModel('gemini-2.0-flash-lite')
+    
+    if stream:
+        return _stream_gemini_response(model, prompt)
     
     max_retries = 3
     base_delay = 10
     
     for attempt in range(max_retries):
         try:
-            response = model.generate_content(prompt)
+            _LIMITER.acquire()
+            with _GEMINI_SEMAPHORE:
+                response = model.generate_content(prompt, generation_config=generation_config)
             return response.text
         except Exception as e:
             if "429" in str(e) or "Quota exceeded" in str(e):
@@ -29,38 +184,94 @@ def get_gemini_response(prompt, api_key):
                 return f"Error: {str(e)}"
     return None
 
+def _stream_gemini_response(model, prompt):
+    """Yields response text as it is generated, so callers can render it before completion."""
+    _LIMITER.acquire()
+    with _GEMINI_SEMAPHORE:
+        for chunk in model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+def _stream_cached(cache, key, prompt, api_key, on_chunk):
+    """
+    Streams a response through on_chunk and returns the full text, or None if the
+    stream failed or was empty. Only complete responses are cached.
+    """
+    with _CACHE_LOCK:
+        cached_text = cache.get(key)
+    if cached_text is not None:
+        on_chunk(cached_text)
+        return cached_text
+    
+    chunks = []
+    try:
+        for chunk in get_gemini_response(prompt, api_key, stream=True):
+            chunks.append(chunk)
+            on_chunk(chunk)
+    except Exception as e:
+        print(f"Gemini streaming error: {e}")
+        return None
+    
+    if not chunks:
+        return None
+    text = "".join(chunks)
+    with _CACHE_LOCK:
+        cache[key] = text
+    return text
+
+@cached(_RESUME_CACHE, key=lambda resume_hash, truncated_resume, api_key: hashkey(resume_hash), lock=_CACHE_LOCK)
+def _parse_cached(resume_hash, truncated_resume, api_key):
+    """Calls Gemini to parse the resume. Raises on failure so nothing is cached."""
+    prompt = _PARSE_PREAMBLE + truncated_resume
+    response_text = _require_response(get_gemini_response(prompt, api_key))
+    return _parse_json_response(response_text)
+
 def parse_resume_with_ai(resume_text, api_key):
     """Extracts Job Role and Skills from resume text."""
-    # Truncate to 800 characters to save tokens on the free tier
-    truncated_resume = resume_text[:800]
-    
-    prompt = f"""
-    Analyze the following resume text and extract the 'Job Role' (e.g., Python Developer, Data Scientist) and a list of 'Key Skills'.
-    Return ONLY valid JSON format like this:
-    {{
-        "role": "extracted role",
-        "skills": ["skill1", "skill2", "skill3"]
-    }}
+    # Truncate to ~266 tokens (the old 800-character budget / 3) to save tokens on the free tier
+    truncated_resume = utils.truncate_tokens(resume_text, 266)
     
-    Resume Text:
-    {truncated_resume}
-    """
     try:
-        response_text = get_gemini_response(prompt, api_key)
-        if not response_text:
-            return {"role": "Software Developer", "skills": ["Python"]}
-        # Clean up json string if it has backticks
-        cleaned = response_text.replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned)
+        return _parse_cached(_text_hash(truncated_resume), truncated_resume, api_key)
+    except RuntimeError:
+        return {"role": "Software Developer", "skills": ["Python"]}
     except Exception as e:
         return {"role": "Software Developer", "skills": [], "error": str(e)}
 
-def search_jobs_jsearch(role, location, rapidapi_key, num_results=3):
+# Precompiled at import time for building best-guess HR emails from listings
+_URL_CLEAN_RE = re.compile(r'^(?:https?://)?(?:www\.)?', re.IGNORECASE)
+_COMPANY_CLEAN_RE = re.compile(r'[\s,.]+')
+
+def _jaccard(a, b):
+    """Jaccard similarity of two token sets (0 when either is empty)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _dedupe_jobs(jobs, threshold=0.85):
+    """Drops jobs whose description is near-identical to an earlier one (e.g. the same posting via an aggregator)."""
+    shingles = [set(job.get("job_description", "").lower().split()) for job in jobs]
+    dropped = set()
+    for i, j in itertools.combinations(range(len(jobs)), 2):
+        if i in dropped or j in dropped:
+            continue
+        if _jaccard(shingles[i], shingles[j]) > threshold:
+            dropped.add(j)
+    return [job for i, job in enumerate(jobs) if i not in dropped]
+
+def search_jobs_jsearch(role, location, rapidapi_key, num_results=3, dedupe_threshold=0.85):
     """
     Fetches real job listings from JSearch API (RapidAPI).
     Free tier: 200 requests/month.
+    Near-duplicate postings (description Jaccard similarity above dedupe_threshold) are dropped.
     Returns a list of job dicts or empty list on failure.
     """
+    cache_key = (role.lower().strip(), location.lower().strip(), num_results, dedupe_threshold)
+    with _CACHE_LOCK:
+        cached_jobs = _JSEARCH_CACHE.get(cache_key)
+    # Callers get their own copies so one session's edits don't leak into the cache
+    if cached_jobs is not None:
+        return [dict(job) for job in cached_jobs]
+    
     url = "https://jsearch.p.rapidapi.com/search"
     
     querystring = {
@@ -76,19 +287,21 @@ def search_jobs_jsearch(role, location, rapidapi_key, num_results=3):
     }
     
     try:
-        response = requests.get(url, headers=headers, params=querystring, timeout=10)
+        response = _http_session().get(url, headers=headers, params=querystring, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         jobs = []
-        for item in data.get("data", [])[:num_results]:
+        # Build every listing on the page so duplicates can be replaced by distinct jobs
+        for item in data.get("data", []):
             # Extract relevant fields
-            company = item.get("employer_name", "Unknown Company")
+            employer_name = item.get("employer_name")
+            company = employer_name or "Unknown Company"
             job_title = item.get("job_title", role)
             job_location = item.get("job_city", location) or location
             
             # Extract job description (truncate to save Gemini tokens later)
-            job_description = item.get("job_description", "")[:800]
+            job_description = utils.truncate_tokens(item.get("job_description", ""), 266)
             
             # Try to get apply email or HR email from the listing
             apply_link = item.get("job_apply_link", "")
@@ -97,11 +310,15 @@ def search_jobs_jsearch(role, location, rapidapi_key, num_results=3):
             # Construct a best-guess HR email from employer name / website
             domain = ""
             if employer_website:
-                domain = employer_website.replace("https://", "").replace("http://", "").replace("www.", "").split("/")[0]
-            elif company:
-                domain = company.lower().replace(" ", "").replace(",", "").replace(".", "") + ".com"
+                domain = _URL_CLEAN_RE.sub("", employer_website).split("/", 1)[0].lower()
+            company_slug = _COMPANY_CLEAN_RE.sub("", (employer_name or "").lower())
+            if not domain and company_slug:
+                domain = company_slug + ".com"
             
-            hr_email = f"hr@{domain}" if domain else f"careers@{company.lower().replace(' ', '')}.com"
+            # Without a website or employer name there's no address to apply to
+            if not domain:
+                continue
+            hr_email = f"hr@{domain}"
             
             jobs.append({
                 "company": company,
@@ -113,6 +330,12 @@ def search_jobs_jsearch(role, location, rapidapi_key, num_results=3):
                 "status": "Found"
             })
         
+        jobs = _dedupe_jobs(jobs, dedupe_threshold)[:num_results]
+        
+        # Empty results aren't cached so a transient miss doesn't stick for 30 minutes
+        if jobs:
+            with _CACHE_LOCK:
+                _JSEARCH_CACHE[cache_key] = [dict(job) for job in jobs]
         return jobs
     except Exception as e:
         print(f"JSearch API error: {e}")
@@ -131,7 +354,7 @@ def simulate_job_discovery(role, location):
             "company": company,
             "role": role,
             "location": location,
-            "hr_email": f"hr@{company.lower().replace(' ', '').replace('.', '')}.com",
+            "hr_email": f"hr@{_COMPANY_CLEAN_RE.sub('', company.lower())}.com",
             "job_description": f"We are looking for a skilled {role} to join our team at {company} in {location}. "
                                f"The ideal candidate should have strong technical skills and experience in software development.",
             "apply_link": "",
@@ -152,31 +375,79 @@ def discover_jobs(role, location, rapidapi_key=""):
     # Fallback to simulation
     return simulate_job_discovery(role, location), "simulated"
 
+def _cover_letter_prompt(resume_text, job):
+    """Builds the single-job cover letter prompt."""
+    return _COVER_PREAMBLE + f"""
+Role: {job.get("role", "the position")}
+Company: {job.get("company", "the company")}
+Job Description: {utils.truncate_tokens(job.get("job_description", ""), 133)}
+
+Candidate Resume (excerpt):
+{utils.truncate_tokens(resume_text, 166)}
+"""
+
+def _cover_letter_key(resume_hash, resume_text, job, api_key):
+    return hashkey(resume_hash, job.get("company"), job.get("role"))
+
+@cached(_COVER_LETTER_CACHE, key=_cover_letter_key, lock=_CACHE_LOCK)
+def _cover_letter_cached(resume_hash, resume_text, job, api_key):
+    """Calls Gemini to draft a cover letter. Raises on failure so nothing is cached."""
+    return _require_response(get_gemini_response(_cover_letter_prompt(resume_text, job), api_key))
+
 def generate_cover_letter(resume_text, job, api_key):
     """Generates a personalized cover letter based on resume and job description."""
-    job_description = job.get("job_description", "")
     company = job.get("company", "the company")
     role = job.get("role", "the position")
     
-    prompt = f"""Write a professional and personalized cover letter for the following job.
-Role: {role}
-Company: {company}
-Job Description: {job_description[:400]}
+    try:
+        return _cover_letter_cached(_text_hash(resume_text), resume_text, job, api_key)
+    except RuntimeError:
+        return _fallback_cover_letter(role, company)
 
-Candidate Resume (first 500 chars):
-{resume_text[:500]}
+_LETTER_SPLIT_RE = re.compile(r'===LETTER_\d+===')
 
-Instructions:
-- Be concise (max 180 words)
-- Mention specific skills that match the job description
-- Be professional and enthusiastic
-- Do NOT use generic phrases like "I am writing to express"
+@cached(_COVER_LETTER_BATCH_CACHE, key=lambda resume_hash, resume_text, jobs, api_key: hashkey(resume_hash, tuple((job.get("company"), job.get("role")) for job in jobs)), lock=_CACHE_LOCK)
+def _cover_letters_batch_cached(resume_hash, resume_text, jobs, api_key):
+    """Calls Gemini once for all cover letters. Raises on failure so nothing is cached."""
+    job_blocks = ""
+    for i, job in enumerate(jobs, 1):
+        job_blocks += f"""
+Job {i}:
+Role: {job.get("role", "the position")}
+Company: {job.get("company", "the company")}
+Job Description: {utils.truncate_tokens(job.get("job_description", ""), 133)}
 """
-    response = get_gemini_response(prompt, api_key)
     
-    if not response:
-        # Fallback Cover Letter
-        return f"""Dear Hiring Manager,
+    prompt = _COVER_BATCH_PREAMBLE + f"""
+Resume: {utils.truncate_tokens(resume_text, 166)}
+{job_blocks}"""
+    response = _require_response(get_gemini_response(prompt, api_key))
+    # Anything before the first marker is preamble, not a letter
+    return [letter.strip() for letter in _LETTER_SPLIT_RE.split(response)[1:]]
+
+def generate_cover_letters_batch(resume_text, jobs, api_key):
+    """
+    Generates cover letters for all jobs in a single Gemini call.
+    Returns one letter per job, in order; missing letters use the fallback.
+    """
+    if not jobs:
+        return []
+    try:
+        letters = _cover_letters_batch_cached(_text_hash(resume_text), resume_text, jobs, api_key)
+    except RuntimeError:
+        letters = []
+    
+    results = []
+    for i, job in enumerate(jobs):
+        if i < len(letters) and letters[i]:
+            results.append(letters[i])
+        else:
+            results.append(_fallback_cover_letter(job.get("role", "the position"), job.get("company", "the company")))
+    return results
+
+def _fallback_cover_letter(role, company):
+    """Template cover letter used when Gemini is unavailable."""
+    return f"""Dear Hiring Manager,
 
 I am excited to apply for the {role} position at {company}. Based on my experience and skills outlined in my resume, I am confident I can make a meaningful contribution to your team.
 
@@ -188,44 +459,57 @@ Sincerely,
 Applicant
 (Note: Generated via Fallback Mode — Gemini API rate limit reached)
         """
-    return response
 
-def generate_interview_questions(role, resume_text, found_jobs, api_key):
-    """
-    Generates interview questions SPECIFIC to the actual job descriptions and resume.
-    This ensures questions are relevant to the actual jobs applied to.
-    """
+def _interview_prompt(role, resume_text, found_jobs):
+    """Builds the interview questions prompt from the applied jobs and resume."""
     # Collect all job descriptions from actually applied jobs
     job_summaries = ""
     for i, job in enumerate(found_jobs[:3], 1):
         company = job.get("company", "Unknown")
-        jd = job.get("job_description", "")[:300]
+        jd = utils.truncate_tokens(job.get("job_description", ""), 100)
         job_summaries += f"\n{i}. {company} - {role}:\n{jd}\n"
     
     # Truncate resume for token efficiency
-    resume_snippet = resume_text[:600]
+    resume_snippet = utils.truncate_tokens(resume_text, 200)
     
-    prompt = f"""You are an expert interview coach. Generate 10 targeted interview questions for a candidate who just applied to the following jobs.
-
+    return _INTERVIEW_PREAMBLE + f"""
 JOBS APPLIED TO:
 {job_summaries}
 
 CANDIDATE RESUME (excerpt):
 {resume_snippet}
+"""
 
-Generate 10 specific interview questions that:
-1. Match the technical skills required in the actual job descriptions above
-2. Reference the candidate's actual experience from their resume
-3. Include both technical and behavioral questions
-4. Are specific — not generic
+def _interview_key(role, resume_hash, resume_text, found_jobs, api_key):
+    return hashkey(role, resume_hash, tuple(job.get("company") for job in found_jobs[:3]))
 
-Format as a numbered list. Each question should be on its own line.
-"""
-    response = get_gemini_response(prompt, api_key)
-    
-    if not response:
-        # Fallback — Role-specific at least
-        return f"""**Standard Interview Questions for {role}** *(Gemini API rate limit reached)*
+@cached(_INTERVIEW_CACHE, key=_interview_key, lock=_CACHE_LOCK)
+def _interview_questions_cached(role, resume_hash, resume_text, found_jobs, api_key):
+    """Calls Gemini for interview questions. Raises on failure so nothing is cached."""
+    return _require_response(get_gemini_response(_interview_prompt(role, resume_text, found_jobs), api_key))
+
+def generate_interview_questions(role, resume_text, found_jobs, api_key):
+    """
+    Generates interview questions SPECIFIC to the actual job descriptions and resume.
+    This ensures questions are relevant to the actual jobs applied to.
+    """
+    try:
+        return _interview_questions_cached(role, _text_hash(resume_text), resume_text, found_jobs, api_key)
+    except RuntimeError:
+        return _fallback_interview_questions(role)
+
+def generate_interview_questions_stream(role, resume_text, found_jobs, api_key, on_chunk):
+    """
+    Streams interview questions, passing each chunk to on_chunk as it arrives.
+    Returns the complete questions, or the fallback list if the stream fails partway.
+    """
+    key = _interview_key(role, _text_hash(resume_text), resume_text, found_jobs, api_key)
+    questions = _stream_cached(_INTERVIEW_CACHE, key, _interview_prompt(role, resume_text, found_jobs), api_key, on_chunk)
+    return questions or _fallback_interview_questions(role)
+
+def _fallback_interview_questions(role):
+    """Role-specific question list used when Gemini is unavailable."""
+    return f"""**Standard Interview Questions for {role}** *(Gemini API rate limit reached)*
 
 1. Walk me through your experience as a {role}.
 2. What tools and technologies do you use daily in your work as a {role}?
@@ -238,4 +522,100 @@ Format as a numbered list. Each question should be on its own line.
 9. How do you handle multiple competing deadlines?
 10. Do you have any questions for the team about the role or company culture?
         """
-    return response
+
+@cached(_BUNDLE_CACHE, key=lambda resume_hash, resume_text, jobs, role, api_key: hashkey(resume_hash, role, tuple((job.get("company"), job.get("role")) for job in jobs)), lock=_CACHE_LOCK)
+def _application_bundle_cached(resume_hash, resume_text, jobs, role, api_key):
+    """Calls Gemini once for the whole application bundle. Raises on failure so nothing is cached."""
+    job_blocks = ""
+    for i, job in enumerate(jobs, 1):
+        job_blocks += f"""
+{i}. Company: {job.get("company", "the company")}
+Role: {job.get("role", role or "the position")}
+Job Description: {utils.truncate_tokens(job.get("job_description", ""), 133)}
+"""
+    role_hint = f"The candidate is targeting the role: {role}\n" if role else ""
+    
+    prompt = _BUNDLE_PREAMBLE + f"""{role_hint}
+RESUME:
+{utils.truncate_tokens(resume_text, 266)}
+
+JOBS:
+{job_blocks}"""
+    response_text = _require_response(get_gemini_response(prompt, api_key, generation_config={"response_mime_type": "application/json"}))
+    data = _parse_json_response(response_text)
+    # Reject malformed shapes here so they raise (and aren't cached) instead of
+    # failing later in generate_application_bundle
+    if not isinstance(data, dict):
+        raise ValueError("Application bundle is not a JSON object")
+    for field in ("skills", "letters"):
+        if not isinstance(data.get(field, []), list):
+            raise ValueError(f"Application bundle field '{field}' is not a list")
+    return data
+
+def _company_key(company):
+    """Normalizes a company name for matching letters to jobs."""
+    return _COMPANY_CLEAN_RE.sub("", str(company or "").lower())
+
+def _match_letters_to_jobs(letters, jobs):
+    """
+    Pairs letters with jobs by the company each letter names, so a reordered or
+    skipped letter is never sent to the wrong employer. Position is only used for
+    letters that don't name one of the jobs. Returns one text (or None) per job.
+    """
+    job_keys = {_company_key(job.get("company")) for job in jobs} - {""}
+    by_company = {}
+    for letter in letters:
+        if isinstance(letter, dict) and letter.get("text"):
+            key = _company_key(letter.get("company"))
+            if key in job_keys:
+                by_company.setdefault(key, []).append(letter["text"])
+    
+    matched = []
+    for i, job in enumerate(jobs):
+        same_company = by_company.get(_company_key(job.get("company")))
+        if same_company:
+            matched.append(same_company.pop(0))
+            continue
+        letter = letters[i] if i < len(letters) else None
+        if isinstance(letter, dict) and _company_key(letter.get("company")) not in job_keys:
+            matched.append(letter.get("text") or None)
+        elif isinstance(letter, str) and letter:
+            matched.append(letter)
+        else:
+            matched.append(None)
+    return matched
+
+def generate_application_bundle(resume_text, jobs, api_key, role="", use_fallbacks=True):
+    """
+    Extracts role and skills and drafts a cover letter per job in a single Gemini call.
+    Interview questions are left to generate_interview_questions_stream, so they can
+    render as they are written.
+    Returns a dict with 'role', 'skills' and 'cover_letters' (one per job).
+    With use_fallbacks=False, pieces missing from the response (or all of them, if it
+    can't be parsed) are None instead of templates. If Gemini gives no response, templates
+    are always used, since retrying the pieces separately would only spend more of an
+    exhausted quota.
+    """
+    try:
+        data = _application_bundle_cached(_text_hash(resume_text), resume_text, jobs, role, api_key)
+    except RuntimeError:
+        data = {}
+        use_fallbacks = True
+    except ValueError:
+        # Malformed JSON or shape; the caller can still generate the pieces separately
+        data = {}
+    
+    bundle_role = role or data.get("role") or "Software Developer"
+    
+    cover_letters = []
+    for job, text in zip(jobs, _match_letters_to_jobs(data.get("letters", []), jobs)):
+        if text or not use_fallbacks:
+            cover_letters.append(text or None)
+        else:
+            cover_letters.append(_fallback_cover_letter(job.get("role", bundle_role), job.get("company", "the company")))
+    
+    return {
+        "role": bundle_role,
+        "skills": data.get("skills", []),
+        "cover_letters": cover_letters,
+    }
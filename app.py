@@ -1,8 +1,7 @@
 import streamlit as st
-import pandas as pd
-import time
 import os
 from datetime import datetime
+from functools import cache
 import utils
 import agents
 from tempfile import NamedTemporaryFile
@@ -16,10 +15,15 @@ st.set_page_config(
 )
 
 # Load CSS
+@st.cache_data
+def read_css(file_name):
+    with open(file_name) as f:
+        return f.read()
+
 def load_css(file_name):
     if os.path.exists(file_name):
-        with open(file_name) as f:
-            st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+        css = read_css(file_name)
+        st.markdown(f'<style>{css}</style>', unsafe_allow_html=True)
     else:
         st.warning(f"Style file {file_name} not found.")
 
@@ -27,6 +31,7 @@ load_css("style.css")
 
 import base64
 
+@st.cache_data
 def get_img_as_base64(file_path):
     with open(file_path, "rb") as f:
         data = f.read()
@@ -97,8 +102,10 @@ if 'stats' not in st.session_state:
     st.session_state['stats'] = {'jobs_found': 0, 'emails_sent': 0, 'skipped': 0}
 if 'logs' not in st.session_state:
     st.session_state['logs'] = []
-if 'results' not in st.session_state:
-    st.session_state['results'] = pd.DataFrame(columns=["Company", "Role", "Location", "Status", "AI Reason"])
+# Result rows are kept as plain dicts; the DataFrame is only built for rendering
+RESULT_COLUMNS = ["Company", "Role", "Location", "Status", "AI Reason"]
+if 'results_rows' not in st.session_state:
+    st.session_state['results_rows'] = []
 
 # Stat Cards
 col1, col2, col3 = st.columns(3)
@@ -122,7 +129,21 @@ st.divider()
 # Results Section (Now Full Width/Primary)
 st.subheader("📊 Application Results")
 results_placeholder = st.empty()
-results_placeholder.dataframe(st.session_state['results'], use_container_width=True)
+
+@cache
+def _get_pd():
+    # pandas is imported on first use to keep it off the cold-start path
+    import pandas as pd
+    return pd
+
+def render_results():
+    # No table until there are results, so an idle page load never imports pandas
+    if not st.session_state['results_rows']:
+        results_placeholder.info("No applications yet. Start the Job Hunt Agent to see results here.")
+        return
+    results_placeholder.dataframe(_get_pd().DataFrame(st.session_state['results_rows'], columns=RESULT_COLUMNS), use_container_width=True)
+
+render_results()
 
 st.divider()
 
@@ -163,22 +184,20 @@ if start_btn:
                 if "Error" in resume_text:
                      st.error(resume_text)
                      st.stop()
+                resume_text = utils.caveman_compress(resume_text)
                 
-                # Extract role if not manually provided
+                # Extract role if not manually provided. With a manual role the
+                # resume is only sent once, in the combined call after job discovery.
                 role = manual_role
                 skills = []
                 
-                update_logs("Analyzing resume with Gemini...")
-                parsed_data = agents.parse_resume_with_ai(resume_text, api_key)
-                
-                # If manual role is set, use it. Otherwise use extracted.
                 if not role:
+                    update_logs("Analyzing resume with Gemini...")
+                    parsed_data = agents.parse_resume_with_ai(resume_text, api_key)
                     role = parsed_data.get("role", "Unknown")
-                
-                skills = parsed_data.get("skills", [])
+                    skills = parsed_data.get("skills", [])
                 
                 update_logs(f"Target Role: {role}")
-                update_logs(f"Skills: {', '.join(skills[:3])}...")
                 
                 # 2. Find Jobs (Real scraping via JSearch or fallback simulation)
                 update_logs(f"Searching for {role} jobs in {location}...")
@@ -195,68 +214,83 @@ if start_btn:
                 if not found_jobs:
                     update_logs("No jobs found. Check your RapidAPI key or try a different role/location.")
                 
-                for job in found_jobs:
+                # 3. Generate Cover Letters (one combined Gemini call)
+                update_logs(f"Drafting cover letters for {len(found_jobs)} jobs...")
+                bundle = agents.generate_application_bundle(resume_text, found_jobs, api_key, role, use_fallbacks=False)
+                cover_letters = bundle["cover_letters"]
+                
+                if not skills:
+                    skills = bundle["skills"]
+                update_logs(f"Skills: {', '.join(skills[:3])}...")
+                
+                # Letters missing from the combined response are drafted in one batched call
+                missing = [i for i, cover_letter in enumerate(cover_letters) if not cover_letter]
+                if missing:
+                    update_logs(f"Drafting {len(missing)} missing cover letters...")
+                    batch = agents.generate_cover_letters_batch(resume_text, [found_jobs[i] for i in missing], api_key)
+                    for i, cover_letter in zip(missing, batch):
+                        cover_letters[i] = cover_letter
+                
+                for job, cover_letter in zip(found_jobs, cover_letters):
                     company = job['company']
                     hr_email = job['hr_email']
                     
-                    update_logs(f"Found job at {company}. Extracting HR email...")
-                    time.sleep(1) # Simulate extraction time
-                    update_logs(f"HR Email found: {hr_email}")
-                    
-                    # 3. Generate Cover Letter
-                    update_logs(f"Drafting cover letter for {company}...")
-                    cover_letter = agents.generate_cover_letter(resume_text, job, api_key)
+                    update_logs(f"Found job at {company}. HR Email found: {hr_email}")
                     
                     with st.expander(f"📄 Cover Letter for {company}", expanded=False):
                         st.markdown(cover_letter)
-                    
-                    # 4. Send Email
-                    update_logs(f"Sending application to {hr_email}...")
-                    # Simulating email send (commented out real send for safety unless explicitly requested to force it, 
-                    # but user requirements say 'Integrate smtplib'. I will call it.)
-                    
-                    email_subject = f"Application for {job['role']} - {company}"
-                    
-                    # ACTUAL SENDING
-                    email_status, email_msg = utils.send_email(email, app_password, hr_email, email_subject, cover_letter, tmp_path)
-                    
-                    if email_status:
-                        update_logs(f"✅ Application Sent to {company}")
-                        st.session_state['stats']['emails_sent'] += 1
-                        status_text = "Sent"
-                        ai_reason = "Matched & Applied"
-                    else:
-                        update_logs(f"❌ Failed to send to {company}")
-                        st.session_state['stats']['skipped'] += 1
-                        status_text = "Failed"
-                        ai_reason = f"Email Error: {email_msg[:20]}..." if email_msg else "Connection Failed"
+                
+                # 4. Send Emails (one authenticated SMTP connection for every application)
+                with utils.SmtpSession(email, app_password) as smtp:
+                    for job, cover_letter in zip(found_jobs, cover_letters):
+                        company = job['company']
+                        update_logs(f"Sending application to {job['hr_email']}...")
+                        email_subject = f"Application for {job['role']} - {company}"
+                        # ACTUAL SENDING
+                        email_status, email_msg = smtp.send(job['hr_email'], email_subject, cover_letter, tmp_path)
+                        
+                        if email_status:
+                            update_logs(f"✅ Application Sent to {company}")
+                            st.session_state['stats']['emails_sent'] += 1
+                            status_text = "Sent"
+                            ai_reason = "Matched & Applied"
+                        else:
+                            update_logs(f"❌ Failed to send to {company}")
+                            st.session_state['stats']['skipped'] += 1
+                            status_text = "Failed"
+                            ai_reason = f"Email Error: {email_msg[:20]}..." if email_msg else "Connection Failed"
 
-                        if "BadCredentials" in email_msg or "Username and Password not accepted" in email_msg:
-                             st.error("Authentication Failed: Please check your Gmail App Password. It is NOT your regular login password. Ensure 2-Step Verification is ON and generate a specific App Password.")
-                    
-                    update_stats()
-                    
-                    # Update Results Table
-                    new_row = {
-                        "Company": company,
-                        "Role": job['role'],
-                        "Location": location,
-                        "Status": status_text,
-                        "AI Reason": ai_reason
-                    }
-                    st.session_state['results'] = pd.concat([st.session_state['results'], pd.DataFrame([new_row])], ignore_index=True)
-                    results_placeholder.dataframe(st.session_state['results'], use_container_width=True)
-                    
-                    time.sleep(20) # Increased delay to 20s to avoid rate limits
+                            if "BadCredentials" in email_msg or "Username and Password not accepted" in email_msg:
+                                 st.error("Authentication Failed: Please check your Gmail App Password. It is NOT your regular login password. Ensure 2-Step Verification is ON and generate a specific App Password.")
+                        
+                        update_stats()
+                        
+                        # Update Results Table
+                        new_row = {
+                            "Company": company,
+                            "Role": job['role'],
+                            "Location": location,
+                            "Status": status_text,
+                            "AI Reason": ai_reason
+                        }
+                        st.session_state['results_rows'].append(new_row)
                 
-                # 5. Interview Prep (based on actual job descriptions + resume)
-                update_logs("Generating personalized interview questions based on your resume & jobs applied...")
-                questions = agents.generate_interview_questions(role, resume_text, found_jobs, api_key)
+                # Render the results table once, after all sends have completed
+                render_results()
                 
+                # 5. Interview Prep (based on actual job descriptions + resume)
                 st.success("Job Hunt Cycle Complete!")
                 st.markdown("### 🎯 Personalized Interview Preparation")
                 st.info("These questions are tailored to the specific companies and job descriptions you applied to.")
-                st.markdown(questions)
+                # Render questions as they stream in; the returned text is complete
+                # (or the fallback list), so it replaces any partial output
+                questions_placeholder = st.empty()
+                streamed = []
+                def show_chunk(chunk):
+                    streamed.append(chunk)
+                    questions_placeholder.markdown("".join(streamed))
+                questions = agents.generate_interview_questions_stream(role, resume_text, found_jobs, api_key, show_chunk)
+                questions_placeholder.markdown(questions)
 
         except Exception as e:
             st.error(f"An error occurred: {e}")
@@ -1,11 +1,12 @@
 import os
+import re
 import smtplib
+from functools import lru_cache
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 import pypdf
-import google.generativeai as genai
 
 def extract_text_from_pdf(file_path):
     """Extracts text from a PDF file."""
@@ -18,28 +19,84 @@ def extract_text_from_pdf(file_path):
     except Exception as e:
         return f"Error reading PDF: {e}"
 
+# Filler phrases and bullet glyphs that carry no meaning for Gemini
+_FILLER_RE = re.compile(r"\b(?:I am writing to|responsible for|duties included|would like|please)\b|\betc\.", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^[\u2022\u25aa\u25cf\u00b7\u2013*-]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_CHAR_RE = re.compile(r"\w")
+
+def caveman_compress(text):
+    """
+    Strips filler from extracted resume text so prompts carry more content per character.
+    Collapses whitespace, drops filler phrases, bullets, lines with no letters or digits and adjacent duplicates.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = _FILLER_RE.sub("", line)
+        line = _WHITESPACE_RE.sub(" ", line).strip()
+        line = _BULLET_RE.sub("", line).strip()
+        # Short lines can still be skills (C, R, Go, C#), so only drop pure punctuation
+        if not _WORD_CHAR_RE.search(line):
+            continue
+        if lines and lines[-1] == line:
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+# Rough local token estimate (not exact): one token per word plus one per punctuation
+# mark, with words longer than 8 characters (identifiers, URLs) costing one token per
+# 8 characters. Roughly tracks BPE tokenizers on English resume text, ~4 chars/token.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_CHARS_PER_TOKEN = 8
+
+@lru_cache(maxsize=64)
+def _token_ends(text):
+    """Character offsets where each estimated token ends. Cached since the same resume is truncated several times per run."""
+    ends = []
+    for match in _TOKEN_RE.finditer(text):
+        for end in range(match.start() + _CHARS_PER_TOKEN, match.end(), _CHARS_PER_TOKEN):
+            ends.append(end)
+        ends.append(match.end())
+    return tuple(ends)
+
+def truncate_tokens(text, max_tokens):
+    """Truncates text to roughly max_tokens tokens, cutting on a token boundary."""
+    ends = _token_ends(text)
+    if len(ends) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    return text[:ends[max_tokens - 1]]
+
 def configure_gemini(api_key):
     """Configures the Gemini API."""
+    # Imported here so importing utils doesn't pull in the Gemini SDK
+    import google.generativeai as genai
     genai.configure(api_key=api_key)
 
-def send_email(sender_email, app_password, recipient_email, subject, body, attachment_path=None):
-    """Sends an email using Gmail SMTP."""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
+def _build_message(sender_email, recipient_email, subject, body, attachment_path=None):
+    """Builds the MIME message for an application email."""
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
 
-        msg.attach(MIMEText(body, 'plain'))
+    msg.attach(MIMEText(body, 'plain'))
 
-        if attachment_path:
-            filename = os.path.basename(attachment_path)
-            attachment = open(attachment_path, "rb")
+    if attachment_path:
+        filename = os.path.basename(attachment_path)
+        with open(attachment_path, "rb") as attachment:
             part = MIMEBase('application', 'octet-stream')
             part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f"attachment; filename= {filename}")
-            msg.attach(part)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f"attachment; filename= {filename}")
+        msg.attach(part)
+    return msg
+
+def send_email(sender_email, app_password, recipient_email, subject, body, attachment_path=None):
+    """Sends an email using Gmail SMTP."""
+    try:
+        msg = _build_message(sender_email, recipient_email, subject, body, attachment_path)
 
         server = smtplib.SMTP('smtp.gmail.com', 587)
         server.starttls()
@@ -50,3 +107,53 @@ def send_email(sender_email, app_password, recipient_email, subject, body, attac
         return True, "Email sent successfully!"
     except Exception as e:
         return False, f"Failed to send email: {e}"
+
+class SmtpSession:
+    """
+    Keeps one authenticated Gmail SMTP connection open for sending several emails.
+    Use as a context manager; send() returns (success, message) like send_email.
+    """
+
+    def __init__(self, sender_email, app_password):
+        self.sender_email = sender_email
+        self.app_password = app_password
+        self._server = None
+        self._error = None
+
+    def _connect(self):
+        """Opens the connection and logs in."""
+        self._server = smtplib.SMTP('smtp.gmail.com', 587)
+        self._server.starttls()
+        self._server.login(self.sender_email, self.app_password)
+
+    def __enter__(self):
+        try:
+            self._connect()
+        except Exception as e:
+            # Reported by every send() so each application shows the failure
+            self._error = e
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+        return False
+
+    def send(self, recipient_email, subject, body, attachment_path=None):
+        """Sends one email over the shared connection, reconnecting once if Gmail dropped it."""
+        if self._error is not None:
+            return False, f"Failed to send email: {self._error}"
+        try:
+            msg = _build_message(self.sender_email, recipient_email, subject, body, attachment_path)
+            text = msg.as_string()
+            try:
+                self._server.sendmail(self.sender_email, recipient_email, text)
+            except smtplib.SMTPServerDisconnected:
+                self._connect()
+                self._server.sendmail(self.sender_email, recipient_email, text)
+            return True, "Email sent successfully!"
+        except Exception as e:
+            return False, f"Failed to send email: {e}"